@@ -1,5 +1,6 @@
 # bot.py
 import os
+from typing import Optional
 import discord
 from discord.commands import SlashCommandGroup
 from discord.ext import commands
@@ -7,14 +8,33 @@ from dotenv import load_dotenv
 
 # --- NEW IMPORTS for Web Logging ---
 import asyncio
+import atexit
+import logging
+import logging.handlers
+import queue
+import time
 from aiohttp import web
 import collections
+import itertools
 from datetime import datetime
 import html # Used to escape characters for safe HTML display
 
 # Use the new asynchronous database module
 import database as db
 
+# --- CONSOLE LOGGING ---
+# Records are queued on the event loop and written to stdout by a background
+# thread, so a slow or full stdout pipe never stalls a command.
+_log_queue = queue.Queue(-1)
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+logging.getLogger().addHandler(logging.handlers.QueueHandler(_log_queue))
+logging.getLogger().setLevel(logging.INFO)
+logger = logging.getLogger("starstream")
+
 # --- CONFIGURATION ---
 load_dotenv()
 BOT_TOKEN = os.getenv('DISCORD_TOKEN')
@@ -25,12 +45,12 @@ try:
     ADMIN_LOG_CHANNEL_ID = int(os.getenv('ADMIN_LOG_CHANNEL_ID'))
 except (TypeError, ValueError):
     ADMIN_LOG_CHANNEL_ID = None
-    print("WARNING: ADMIN_LOG_CHANNEL_ID not found or invalid in .env file. Admin channel logging is disabled.")
+    logger.warning("ADMIN_LOG_CHANNEL_ID not found or invalid in .env file. Admin channel logging is disabled.")
 
 
 # Thematic role/user IDs for those who can influence the "Star Stream"
-CONSTELLATION_USER_IDS = [1374059561417441324, 1072508556907139133] # Formerly GENERATOR_USER_IDS
-CONSTELLATION_ROLE_IDS = [1382422834965385318, 1382423081565425694] # Formerly GENERATOR_ROLE_IDS
+CONSTELLATION_USER_IDS = frozenset({1374059561417441324, 1072508556907139133}) # Formerly GENERATOR_USER_IDS
+CONSTELLATION_ROLE_IDS = frozenset({1382422834965385318, 1382423081565425694}) # Formerly GENERATOR_ROLE_IDS
 
 # Thematic Currency Name
 CURRENCY_NAME = "Starstream Coin"
@@ -45,7 +65,18 @@ intents = discord.Intents.default()
 intents.members = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix="/", intents=intents)
+class StarStreamBot(commands.Bot):
+    async def start(self, *args, **kwargs):
+        """Opens the shared database connection before connecting, so early commands can use it."""
+        await db.init_db()
+        await super().start(*args, **kwargs)
+
+    async def close(self):
+        """Closes the shared database connection before disconnecting."""
+        await db.close_db()
+        await super().close()
+
+bot = StarStreamBot(command_prefix="/", intents=intents)
 # --- END BOT SETUP ---
 
 # --- THEME & EMBED FACTORY ---
@@ -54,10 +85,11 @@ class EmbedFactory:
     FOOTER_TEXT = "A Message from the Star Stream"
     
     @staticmethod
-    def create(title: str, color: discord.Color, description: str = "", **kwargs) -> discord.Embed:
-        embed = discord.Embed(title=title, description=description, color=color, **kwargs)
-        if "author_name" in kwargs and "author_icon" in kwargs:
-            embed.set_author(name=kwargs["author_name"], icon_url=kwargs["author_icon"])
+    def create(title: str, color: discord.Color, description: str = "", *, timestamp: Optional[datetime] = None,
+               author_name: Optional[str] = None, author_icon: Optional[str] = None) -> discord.Embed:
+        embed = discord.Embed(title=title, description=description, color=color, timestamp=timestamp)
+        if author_name:
+            embed.set_author(name=author_name, icon_url=author_icon)
         embed.set_footer(text=EmbedFactory.FOOTER_TEXT)
         return embed
 
@@ -65,37 +97,60 @@ class EmbedFactory:
 def is_constellation(ctx: discord.ApplicationContext) -> bool:
     """Check if the user is a 'Constellation' (admin/generator)."""
     author = ctx.author
-    if author.id in CONSTELLATION_USER_IDS: return True
-    author_role_ids = [role.id for role in author.roles]
-    if any(role_id in CONSTELLATION_ROLE_IDS for role_id in author_role_ids): return True
-    return False
+    return author.id in CONSTELLATION_USER_IDS or any(role.id in CONSTELLATION_ROLE_IDS for role in author.roles)
 
 # --- LOGGING & WEB SERVER (MODIFIED) ---
 # A deque is a memory-efficient list that discards old entries when full.
 LOG_CACHE = collections.deque(maxlen=200)
 
+# Resolved in on_ready so send_log normally skips the fetch_channel REST call.
+# Stays None if that lookup failed, in which case the next log retries it.
+_log_channel = None
+# Strong references to fire-and-forget tasks so they aren't garbage collected mid-send.
+_background_tasks = set()
+
+def run_in_background(coro):
+    """Schedules a coroutine without awaiting it, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def resolve_log_channel():
+    """Looks up the admin log channel, falling back to the API if it isn't cached."""
+    global _log_channel
+    if not ADMIN_LOG_CHANNEL_ID:
+        return
+    try:
+        _log_channel = bot.get_channel(ADMIN_LOG_CHANNEL_ID) or await bot.fetch_channel(ADMIN_LOG_CHANNEL_ID)
+    except discord.NotFound:
+        logger.error(f"Admin log channel with ID {ADMIN_LOG_CHANNEL_ID} not found.")
+    except discord.Forbidden:
+        logger.error(f"Bot does not have permission to view the admin log channel ({ADMIN_LOG_CHANNEL_ID}).")
+    except Exception as e:
+        logger.error(f"Failed to resolve admin log channel. {e}")
+
+async def _post_to_log_channel(embed: discord.Embed):
+    """Posts a log embed to the admin channel, resolving it first if it isn't cached yet."""
+    if _log_channel is None:
+        await resolve_log_channel()
+        if _log_channel is None:
+            return
+    try:
+        await _log_channel.send(embed=embed)
+    except discord.Forbidden:
+        logger.error(f"Bot does not have permission to send messages in the admin log channel ({ADMIN_LOG_CHANNEL_ID}).")
+    except Exception as e:
+        logger.error(f"Failed to send log to admin channel. {e}")
+
 async def send_log(embed: discord.Embed):
     """
     [MODIFIED]
     Sends a log to the admin channel and adds it to the web log cache.
+    The admin channel post runs in the background so commands aren't held up by it.
     """
     # --- 1. Send to Discord Admin Channel ---
     if ADMIN_LOG_CHANNEL_ID:
-        try:
-            # Use get_channel first as it's faster (uses cache)
-            log_channel = bot.get_channel(ADMIN_LOG_CHANNEL_ID)
-            if log_channel:
-                await log_channel.send(embed=embed)
-            else:
-                # If not in cache, fetch it from the API
-                log_channel = await bot.fetch_channel(ADMIN_LOG_CHANNEL_ID)
-                await log_channel.send(embed=embed)
-        except discord.NotFound:
-            print(f"ERROR: Admin log channel with ID {ADMIN_LOG_CHANNEL_ID} not found.")
-        except discord.Forbidden:
-            print(f"ERROR: Bot does not have permission to send messages in the admin log channel ({ADMIN_LOG_CHANNEL_ID}).")
-        except Exception as e:
-            print(f"ERROR: Failed to send log to admin channel. {e}")
+        run_in_background(_post_to_log_channel(embed))
 
     # --- 2. Format for and add to Web Log Cache ---
     ts = f"<span class='timestamp'>{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</span>"
@@ -117,17 +172,20 @@ async def send_log(embed: discord.Embed):
 # [NEW FUNCTION]
 async def send_purchase_log_to_constellations(embed: discord.Embed):
     """Sends a log embed via DM to each user defined as a Constellation."""
-    for user_id in CONSTELLATION_USER_IDS:
-        try:
-            user = bot.get_user(user_id) or await bot.fetch_user(user_id)
-            if user and not user.bot:
-                await user.send(embed=embed)
-        except discord.NotFound:
-            print(f"WARNING: Constellation user with ID {user_id} not found for DM.")
-        except discord.Forbidden:
-            print(f"WARNING: Could not DM Constellation user {user_id}. They may have DMs disabled or have blocked the bot.")
-        except Exception as e:
-            print(f"ERROR: An unexpected error occurred while trying to DM Constellation {user_id}: {e}")
+    await asyncio.gather(*(_dm_constellation(user_id, embed) for user_id in CONSTELLATION_USER_IDS))
+
+async def _dm_constellation(user_id: int, embed: discord.Embed):
+    """DMs a log embed to a single Constellation."""
+    try:
+        user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+        if user and not user.bot:
+            await user.send(embed=embed)
+    except discord.NotFound:
+        logger.warning(f"Constellation user with ID {user_id} not found for DM.")
+    except discord.Forbidden:
+        logger.warning(f"Could not DM Constellation user {user_id}. They may have DMs disabled or have blocked the bot.")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred while trying to DM Constellation {user_id}: {e}")
 
 
 async def web_log_viewer(request):
@@ -178,9 +236,9 @@ async def start_web_server():
     site = web.TCPSite(runner, '0.0.0.0', 5000)
     try:
         await site.start()
-        print(f"INFO: Log viewer server started. Access it at http://localhost:5000")
+        logger.info(f"Log viewer server started. Access it at http://localhost:5000")
     except Exception as e:
-        print(f"ERROR: Could not start web server on port 5000. {e}")
+        logger.error(f"Could not start web server on port 5000. {e}")
 # --- END MODIFIED SECTION ---
 
 
@@ -188,10 +246,10 @@ async def start_web_server():
 @bot.event
 async def on_ready():
     """Event: The Star Stream connection is stable."""
-    print(f'Logged in as {bot.user} | The Star Stream is watching.')
-    await db.init_db()
+    logger.info(f'Logged in as {bot.user} | The Star Stream is watching.')
+    await resolve_log_channel()
     await bot.sync_commands()
-    print("All Scenarios (Commands) have been synced with Discord.")
+    logger.info("All Scenarios (Commands) have been synced with Discord.")
     # Start the web server as a background task so it doesn't block the bot
     asyncio.create_task(start_web_server())
 
@@ -200,13 +258,47 @@ async def on_ready():
 async def autocomplete_shop_items(ctx: discord.AutocompleteContext):
     """Autocompletes item names for the Dokkaebi Bag."""
     if not ctx.interaction.guild: return []
-    items = await db.get_all_shop_items(ctx.interaction.guild.id)
-    return [item['name'] for item in items if item['name'].lower().startswith(ctx.value.lower())]
+    names = await db.get_shop_item_names(ctx.interaction.guild.id)
+    prefix = ctx.value.lower()
+    # Discord only displays 25 choices, so stop filtering once we have them.
+    return list(itertools.islice((name for name in names if name.lower().startswith(prefix)), 25))
 
 # --- USER COMMANDS ---
+# Resolved mentions keyed by user ID, as (resolved_at, mention or None if the user is gone).
+# Kept longer than the DB cache so repeated views don't re-hit the Discord API.
+USER_DISPLAY_TTL = 300
+_user_display_cache = {}
+
+async def resolve_mentions(user_ids) -> dict:
+    """Maps user IDs to mentions (None for unknown users), fetching every cache miss concurrently."""
+    now = time.monotonic()
+    mentions = {}
+    missing = []
+    for uid in user_ids:
+        cached = _user_display_cache.get(uid)
+        if cached and now - cached[0] < USER_DISPLAY_TTL:
+            mentions[uid] = cached[1]
+        elif (user := bot.get_user(uid)):
+            mentions[uid] = user.mention
+            _user_display_cache[uid] = (now, user.mention)
+        else:
+            missing.append(uid)
+
+    # Fetch every uncached Incarnation at once instead of one REST call at a time.
+    fetched = await asyncio.gather(*(bot.fetch_user(uid) for uid in missing), return_exceptions=True)
+    for uid, result in zip(missing, fetched):
+        if isinstance(result, Exception):
+            mentions[uid] = None
+            if not isinstance(result, discord.NotFound):
+                continue # Don't remember transient API failures
+        else:
+            mentions[uid] = result.mention
+        _user_display_cache[uid] = (now, mentions[uid])
+    return mentions
+
 @bot.slash_command(name="balance", description=f"Examine your or another Incarnation's {CURRENCY_NAME} balance.")
 async def balance(ctx: discord.ApplicationContext, user: discord.Option(discord.Member, "The Incarnation to view.", required=False)):
-    # This command is fast enough, so no deferral is needed.
+    await ctx.defer()
     target_user = user or ctx.author
     user_balance = await db.get_balance(target_user.id)
     
@@ -216,7 +308,7 @@ async def balance(ctx: discord.ApplicationContext, user: discord.Option(discord.
         color=discord.Color.gold()
     )
     embed.set_thumbnail(url=target_user.display_avatar.url)
-    await ctx.respond(embed=embed)
+    await ctx.followup.send(embed=embed)
 
 @bot.slash_command(name="pay", description=f"Share your story by sending {CURRENCY_NAME}s to another.")
 async def pay(ctx: discord.ApplicationContext, recipient: discord.Option(discord.Member, "The Incarnation to receive your story."), amount: discord.Option(int, "The amount of Coin to send.")):
@@ -229,7 +321,8 @@ async def pay(ctx: discord.ApplicationContext, recipient: discord.Option(discord
     if recipient.id == sender.id:
         return await ctx.followup.send("You cannot write a story for yourself.", ephemeral=True)
 
-    if await db.transfer_coins(sender.id, recipient.id, amount):
+    balance = await db.transfer_coins(sender.id, recipient.id, amount)
+    if balance is None:
         embed = EmbedFactory.create(
             title="「Fable Weaving」",
             description=f"A new story has been woven. You sent **{amount:,} {CURRENCY_SYMBOL}** to {recipient.mention}.",
@@ -248,7 +341,6 @@ async def pay(ctx: discord.ApplicationContext, recipient: discord.Option(discord
         log_embed.add_field(name="Amount", value=f"**{amount:,} {CURRENCY_SYMBOL}**", inline=False)
         await send_log(log_embed)
     else:
-        balance = await db.get_balance(sender.id)
         embed = EmbedFactory.create(
             title="「Transaction Failed」",
             description=f"Your Fable is insufficient. You only possess **{balance:,} {CURRENCY_SYMBOL}**.",
@@ -256,6 +348,9 @@ async def pay(ctx: discord.ApplicationContext, recipient: discord.Option(discord
         )
         await ctx.followup.send(embed=embed, ephemeral=True)
 
+# Emojis for the top three ranks; everyone else gets a plain "#N".
+_MEDALS = ("🥇", "🥈", "🥉")
+
 @bot.slash_command(name="leaderboard", description="View the Ranking Scenario for the wealthiest Incarnations.")
 async def leaderboard(ctx: discord.ApplicationContext):
     await ctx.defer()  # <-- FIX: Defer the response immediately.
@@ -269,19 +364,12 @@ async def leaderboard(ctx: discord.ApplicationContext):
         embed.description = "The ranking is currently empty. No great Fables have been told."
         return await ctx.followup.send(embed=embed) # <-- FIX: Use followup.send
     
-    desc = []
-    for rank, record in enumerate(top_users, 1):
-        try:
-            # This is the slow part that caused the original error.
-            user = bot.get_user(record['user_id']) or await bot.fetch_user(record['user_id'])
-            user_display = user.mention
-        except discord.NotFound:
-            user_display = f"An Forgotten Incarnation (ID: {record['user_id']})"
-        
-        emoji = "🥇" if rank == 1 else "🥈" if rank == 2 else "🥉" if rank == 3 else f"**#{rank}**"
-        desc.append(f"{emoji} {user_display} — **{record['balance']:,} {CURRENCY_SYMBOL}**")
-        
-    embed.description = "\n".join(desc)
+    mentions = await resolve_mentions([record['user_id'] for record in top_users])
+    displays = {uid: mention or f"An Forgotten Incarnation (ID: {uid})" for uid, mention in mentions.items()}
+    embed.description = "\n".join(
+        f"{_MEDALS[rank] if rank < 3 else f'**#{rank + 1}**'} {displays[record['user_id']]} — **{record['balance']:,} {CURRENCY_SYMBOL}**"
+        for rank, record in enumerate(top_users)
+    )
     await ctx.followup.send(embed=embed) # <-- FIX: Use followup.send
 
 # --- CONSTELLATION COMMANDS ---
@@ -411,12 +499,29 @@ async def shop_add(ctx: discord.ApplicationContext,
     else:
         await ctx.followup.send(f"An Artifact with the name '{name}' already exists in this channel.", ephemeral=True)
 
+def _format_shop_item(item, role, purchasers: dict) -> str:
+    """Renders one Artifact's entry for the shop view."""
+    if not item['is_one_time_buy']:
+        status = ""
+    elif item['purchased_by_user_id']:
+        purchaser = purchasers[item['purchased_by_user_id']] or f"Forgotten Incarnation (ID: {item['purchased_by_user_id']})"
+        status = f"**Status:** 🔴 CLAIMED (by {purchaser})\n"
+    else:
+        status = "**Type:** ✨ Hidden Piece (Unique)\n"
+    return (
+        f"### {item['name']}\n"
+        f"**Cost:** {item['cost']:,} {CURRENCY_SYMBOL}\n"
+        f"**Reward:** {role.mention if role else '`Faded Stigma`'}\n"
+        f"{status}"
+    )
+
 @shop.command(name="view", description="Peer into the Dokkaebi Bag.")
 async def shop_view(ctx: discord.ApplicationContext):
+    # Checks that don't touch the DB answer directly, before deferring.
+    if not ctx.guild:
+        return await ctx.respond("The Dokkaebi Bag only opens within a guild.", ephemeral=True)
     await ctx.defer() # <-- FIX: Defer the response immediately.
     
-    if not ctx.guild:
-        return await ctx.followup.send("The Dokkaebi Bag only opens within a guild.", ephemeral=True)
     items = await db.get_all_shop_items(ctx.guild.id)
     embed = EmbedFactory.create(
         title=f"「{ctx.guild.name}'s Dokkaebi Bag」",
@@ -425,34 +530,21 @@ async def shop_view(ctx: discord.ApplicationContext):
     if not items:
         embed.description = "The Bag is currently empty. A Constellation must add Artifacts."
     else:
-        desc = []
-        for item in items:
-            role = ctx.guild.get_role(item['role_id'])
-            item_line = f"### {item['name']}\n"
-            item_line += f"**Cost:** {item['cost']:,} {CURRENCY_SYMBOL}\n"
-            item_line += f"**Reward:** {role.mention if role else '`Faded Stigma`'}\n"
-            if item['is_one_time_buy']:
-                if item['purchased_by_user_id']:
-                    try:
-                        # This is the slow part that caused the original error.
-                        purchaser = bot.get_user(item['purchased_by_user_id']) or await bot.fetch_user(item['purchased_by_user_id'])
-                        purchaser_mention = purchaser.mention
-                    except discord.NotFound:
-                        purchaser_mention = f"Forgotten Incarnation (ID: {item['purchased_by_user_id']})"
-                    item_line += f"**Status:** 🔴 CLAIMED (by {purchaser_mention})\n"
-                else:
-                    item_line += "**Type:** ✨ Hidden Piece (Unique)\n"
-            desc.append(item_line)
-        embed.description = "\n".join(desc)
+        # Resolve every claimant up front rather than awaiting them one item at a time.
+        purchasers = await resolve_mentions({
+            item['purchased_by_user_id'] for item in items
+            if item['is_one_time_buy'] and item['purchased_by_user_id']
+        })
+        embed.description = "\n".join(_format_shop_item(item, ctx.guild.get_role(item['role_id']), purchasers) for item in items)
     await ctx.followup.send(embed=embed) # <-- FIX
 
 @shop.command(name="buy", description="Make a contract to buy an Artifact.")
 async def shop_buy(ctx: discord.ApplicationContext, name: discord.Option(str, "The name of the Artifact to buy.", autocomplete=autocomplete_shop_items)):
+    if not ctx.guild:
+        return await ctx.respond("Contracts can only be made in a guild.", ephemeral=True)
     await ctx.defer(ephemeral=True)
     
-    if not ctx.guild:
-        return await ctx.followup.send("Contracts can only be made in a guild.", ephemeral=True)
-    item = await db.get_shop_item(ctx.guild.id, name)
+    item = await db.get_shop_item_for_buy(ctx.guild.id, name)
     if not item:
         return await ctx.followup.send(f"The Star Stream cannot find an Artifact named '{name}'.", ephemeral=True)
     if item['is_one_time_buy'] and item['purchased_by_user_id']:
@@ -472,41 +564,50 @@ async def shop_buy(ctx: discord.ApplicationContext, name: discord.Option(str, "T
     if role_to_grant.position >= ctx.guild.me.top_role.position:
         return await ctx.followup.send("Bot Error: This Dokkaebi cannot grant a Stigma that is higher than its own station.", ephemeral=True)
 
+    # Debit (and claim a Hidden Piece) in one commit before touching the Discord API.
+    if not await db.debit_and_mark(ctx.author.id, item['cost'], item['item_id'], item['is_one_time_buy']):
+        return await ctx.followup.send("The contract could not be sealed. Your Fable fell short or the Hidden Piece was just claimed.", ephemeral=True)
+
+    try:
+        await ctx.author.add_roles(role_to_grant, reason=f"Purchased Artifact '{name}'")
+    except Exception as e:
+        logger.error(f"An error occurred during purchase, refunding user. Error: {e}")
+        await db.refund_purchase(ctx.author.id, item['cost'], item['item_id'], item['is_one_time_buy'])
+        return await ctx.followup.send("A fatal error occurred in the Star Stream. The contract has been voided and your Coins returned.", ephemeral=True)
+
+    embed = EmbedFactory.create(
+        title="「Contract Fulfilled」",
+        description=f"You acquired the Artifact **{name}** for **{item['cost']:,} {CURRENCY_SYMBOL}**.",
+        color=discord.Color.green()
+    )
+    embed.add_field(name="Stigma Acquired", value=f"You have been granted the {role_to_grant.mention} Stigma!")
+    if item['image_url']: embed.set_thumbnail(url=item['image_url'])
     try:
-        # Perform transaction
-        await db.add_coins(ctx.author.id, -item['cost'])
-        await ctx.author.add_roles(role_to_grant, reason=f"Purchased Artifact '{item['name']}'")
-        if item['is_one_time_buy']:
-            await db.mark_item_as_purchased(item['item_id'], ctx.author.id)
-        
-        embed = EmbedFactory.create(
-            title="「Contract Fulfilled」",
-            description=f"You acquired the Artifact **{item['name']}** for **{item['cost']:,} {CURRENCY_SYMBOL}**.",
-            color=discord.Color.green()
-        )
-        embed.add_field(name="Stigma Acquired", value=f"You have been granted the {role_to_grant.mention} Stigma!")
-        if item['image_url']: embed.set_thumbnail(url=item['image_url'])
         # Send public success message. Since we deferred ephemerally, this is a new message.
         await ctx.author.send(embed=embed)
         await ctx.followup.send("Your contract has been fulfilled! I've sent the details to your DMs.", ephemeral=True)
+    except discord.HTTPException as e:
+        # The purchase already went through, so fall back to showing the receipt here
+        # and make sure the sale is still logged below.
+        logger.warning(f"Could not DM purchase receipt to {ctx.author.id}: {e}")
+        try:
+            await ctx.followup.send(embed=embed, ephemeral=True)
+        except discord.HTTPException as e:
+            logger.error(f"Could not deliver purchase receipt to {ctx.author.id}: {e}")
 
-        # --- Logging ---
-        log_embed = EmbedFactory.create(
-            title="Akashic Record: Artifact Purchase",
-            color=discord.Color.purple(),
-            timestamp=discord.utils.utcnow()
-        )
-        log_embed.add_field(name="Incarnation", value=f"{ctx.author.mention} (`{ctx.author.id}`)", inline=False)
-        log_embed.add_field(name="Artifact", value=item['name'], inline=True)
-        log_embed.add_field(name="Cost", value=f"**{item['cost']:,} {CURRENCY_SYMBOL}**", inline=True)
-        
-        await send_log(log_embed)
-        await send_purchase_log_to_constellations(log_embed)
-        
-    except Exception as e:
-        print(f"An error occurred during purchase, refunding user. Error: {e}")
-        await ctx.followup.send("A fatal error occurred in the Star Stream. The contract has been voided and your Coins returned.", ephemeral=True)
-        await db.add_coins(ctx.author.id, item['cost']) # Refund on any failure
+    # --- Logging ---
+    log_embed = EmbedFactory.create(
+        title="Akashic Record: Artifact Purchase",
+        color=discord.Color.purple(),
+        timestamp=discord.utils.utcnow()
+    )
+    log_embed.add_field(name="Incarnation", value=f"{ctx.author.mention} (`{ctx.author.id}`)", inline=False)
+    log_embed.add_field(name="Artifact", value=name, inline=True)
+    log_embed.add_field(name="Cost", value=f"**{item['cost']:,} {CURRENCY_SYMBOL}**", inline=True)
+    
+    await send_log(log_embed)
+    # The buyer already has their reply, so the Constellation DMs don't need to hold the handler.
+    run_in_background(send_purchase_log_to_constellations(log_embed))
 
 @shop.command(name="remove", description="[CONSTELLATION] Remove an Artifact from the Dokkaebi Bag.")
 async def shop_remove(ctx: discord.ApplicationContext, name: discord.Option(str, "The name of the Artifact to remove.", autocomplete=autocomplete_shop_items)):
@@ -542,6 +643,6 @@ bot.add_application_command(shop)
 if __name__ == "__main__":
     # You will need to install aiohttp: pip install aiohttp
     if not BOT_TOKEN:
-        print("Fatal Error: DISCORD_TOKEN not found in .env file. The Star Stream cannot connect.")
+        logger.critical("DISCORD_TOKEN not found in .env file. The Star Stream cannot connect.")
     else:
         bot.run(BOT_TOKEN)
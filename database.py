@@ -1,19 +1,81 @@
 # database.py
+import asyncio
+import contextlib
+import logging
+import time
 import aiosqlite
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 DB_FILE = "starstream.db"
 
+logger = logging.getLogger("starstream.database")
+
+# A single long-lived connection shared by every query, opened in init_db().
+_db: Optional[aiosqlite.Connection] = None
+# Serializes every statement on the shared connection. Writes hold it for their whole
+# transaction so they can't split each other, and reads hold it so they never see a
+# transaction another command has left half-applied.
+_db_lock = asyncio.Lock()
+
+# Leaderboard results keyed by limit, as (fetched_at, rows). Cleared whenever a balance changes.
+LEADERBOARD_TTL = 30
+_lb_cache: Dict[int, Tuple[float, List[Dict[str, Any]]]] = {}
+
+def _invalidate_lb():
+    """Drops cached leaderboards after a balance change."""
+    _lb_cache.clear()
+
+# Shop item names keyed by guild, as (fetched_at, names). Serves autocomplete on every keystroke.
+SHOP_NAMES_TTL = 60
+_shop_names: Dict[int, Tuple[float, List[str]]] = {}
+
+def get_db() -> aiosqlite.Connection:
+    """Returns the shared database connection."""
+    if _db is None:
+        raise RuntimeError("Database has not been initialized. Call init_db() first.")
+    return _db
+
+@contextlib.asynccontextmanager
+async def _transaction():
+    """
+    Holds the connection lock for one BEGIN IMMEDIATE block. The block must commit explicitly;
+    any other exit, including an early return, an error or cancellation, rolls it back.
+    """
+    async with _db_lock:
+        db = get_db()
+        try:
+            await db.execute("BEGIN IMMEDIATE")
+            yield db
+        except BaseException:
+            # A cancelled await may still be queued on the worker thread, so always queue the
+            # rollback behind it. rollback() is a no-op if SQLite already ended the transaction.
+            await db.rollback()
+            raise
+        else:
+            if db.in_transaction: # The block returned early without committing
+                await db.rollback()
+
 async def init_db():
-    """Initializes the database and creates tables if they don't exist."""
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute('''
+    """Opens the shared connection and creates tables if they don't exist. Safe to call again."""
+    global _db
+    # The lock keeps the schema script's implicit COMMIT away from other commands' transactions.
+    async with _db_lock:
+        if _db is not None:
+            return
+        conn = await aiosqlite.connect(DB_FILE)
+        # Every query on the shared connection returns rows addressable by column name.
+        conn.row_factory = aiosqlite.Row
+        await conn.executescript('''
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+        ''')
+        # One script keeps startup to a single round-trip for the whole schema.
+        await conn.executescript('''
             CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER PRIMARY KEY,
                 balance INTEGER NOT NULL DEFAULT 0
-            )
-        ''')
-        await db.execute('''
+            );
             CREATE TABLE IF NOT EXISTS shop_items (
                 item_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 guild_id INTEGER NOT NULL,
@@ -24,94 +86,183 @@ async def init_db():
                 is_one_time_buy BOOLEAN NOT NULL DEFAULT 0,
                 purchased_by_user_id INTEGER,
                 UNIQUE(guild_id, name)
-            )
+            );
+            -- Lets the leaderboard walk the top balances without sorting the whole table.
+            CREATE INDEX IF NOT EXISTS idx_users_balance ON users(balance DESC);
+            -- UNIQUE(guild_id, name) already indexes name lookups; this serves the cost-ordered listing.
+            CREATE INDEX IF NOT EXISTS idx_shop_guild_cost ON shop_items(guild_id, cost);
         ''')
-        await db.commit()
-    print("Database connection established and tables verified.")
+        _db = conn
+        logger.info("Database connection established and tables verified.")
 
-async def _get_or_create_user(cursor, user_id: int):
-    """Ensures a user exists in the database, creating them if not."""
-    await cursor.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,))
-    if await cursor.fetchone() is None:
-        await cursor.execute("INSERT INTO users (user_id, balance) VALUES (?, 0)", (user_id,))
+async def close_db():
+    """Closes the shared database connection."""
+    global _db
+    if _db is not None:
+        await _db.close()
+        _db = None
 
 async def get_balance(user_id: int) -> int:
-    """Gets a user's balance."""
-    async with aiosqlite.connect(DB_FILE) as db:
-        async with db.cursor() as cursor:
-            await _get_or_create_user(cursor, user_id)
-            await cursor.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,))
+    """Gets a user's balance. Users without a row simply hold 0."""
+    db = get_db()
+    async with _db_lock:
+        async with db.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)) as cursor:
             result = await cursor.fetchone()
-            return result[0] if result else 0
+    return result["balance"] if result else 0
 
 async def add_coins(user_id: int, amount: int):
     """Adds or removes coins from a user's balance."""
-    async with aiosqlite.connect(DB_FILE) as db:
-        async with db.cursor() as cursor:
-            await _get_or_create_user(cursor, user_id)
-            await cursor.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (amount, user_id))
+    async with _transaction() as db:
+        await db.execute(
+            "INSERT INTO users (user_id, balance) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance",
+            (user_id, amount)
+        )
         await db.commit()
+    _invalidate_lb()
 
-async def transfer_coins(sender_id: int, recipient_id: int, amount: int) -> bool:
-    """Atomically transfers coins from one user to another."""
-    async with aiosqlite.connect(DB_FILE) as db:
-        sender_balance = await get_balance(sender_id)
-        if sender_balance < amount:
-            return False
-        async with db.cursor() as cursor:
-            await _get_or_create_user(cursor, recipient_id)
-            await cursor.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (amount, sender_id))
-            await cursor.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (amount, recipient_id))
+async def add_coins_bulk(pairs: List[Tuple[int, int]]):
+    """Adds or removes coins for many (user_id, amount) pairs in a single transaction."""
+    async with _transaction() as db:
+        await db.executemany(
+            "INSERT INTO users (user_id, balance) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance",
+            pairs
+        )
+        await db.commit()
+    _invalidate_lb()
+
+async def transfer_coins(sender_id: int, recipient_id: int, amount: int) -> Optional[int]:
+    """
+    Atomically transfers coins from one user to another.
+    Returns None on success, or the sender's current balance if they couldn't afford it.
+    """
+    async with _transaction() as db:
+        # The balance guard makes the check and the debit a single statement.
+        async with db.execute(
+            "UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ?",
+            (amount, sender_id, amount)
+        ) as cursor:
+            debited = cursor.rowcount > 0
+        if not debited:
+            # Read the balance inside the same transaction so the caller can report it for free.
+            async with db.execute("SELECT balance FROM users WHERE user_id = ?", (sender_id,)) as cursor:
+                result = await cursor.fetchone()
+            return result["balance"] if result else 0
+        await db.execute(
+            "INSERT INTO users (user_id, balance) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance",
+            (recipient_id, amount)
+        )
         await db.commit()
-        return True
+    _invalidate_lb()
+    return None
 
 async def get_leaderboard(limit: int = 10) -> List[Dict[str, Any]]:
-    """Gets the top N users by balance."""
-    async with aiosqlite.connect(DB_FILE) as db:
-        db.row_factory = aiosqlite.Row
+    """Gets the top N users by balance, served from a short-lived cache."""
+    cached = _lb_cache.get(limit)
+    if cached and time.monotonic() - cached[0] < LEADERBOARD_TTL:
+        return cached[1]
+    db = get_db()
+    async with _db_lock:
         async with db.execute("SELECT user_id, balance FROM users ORDER BY balance DESC LIMIT ?", (limit,)) as cursor:
-            return [dict(row) for row in await cursor.fetchall()]
+            rows = [dict(row) for row in await cursor.fetchall()]
+    _lb_cache[limit] = (time.monotonic(), rows)
+    return rows
 
 # --- Shop Functions ---
 
 async def add_shop_item(guild_id: int, name: str, cost: int, role_id: int, image_url: Optional[str], one_time_buy: bool) -> bool:
     """Adds a new item to the shop."""
-    try:
-        async with aiosqlite.connect(DB_FILE) as db:
+    async with _transaction() as db:
+        try:
             await db.execute(
                 "INSERT INTO shop_items (guild_id, name, cost, role_id, image_url, is_one_time_buy) VALUES (?, ?, ?, ?, ?, ?)",
                 (guild_id, name, cost, role_id, image_url, one_time_buy)
             )
-            await db.commit()
-        return True
-    except aiosqlite.IntegrityError: # Handles UNIQUE constraint violation
-        return False
+        except aiosqlite.IntegrityError: # Handles UNIQUE constraint violation
+            return False
+        await db.commit()
+    _shop_names.pop(guild_id, None)
+    return True
 
 async def remove_shop_item(guild_id: int, name: str) -> bool:
     """Removes an item from the shop."""
-    async with aiosqlite.connect(DB_FILE) as db:
-        async with db.cursor() as cursor:
-            await cursor.execute("DELETE FROM shop_items WHERE guild_id = ? AND name = ?", (guild_id, name))
-            await db.commit()
-            return cursor.rowcount > 0
-
-async def get_shop_item(guild_id: int, name: str) -> Optional[Dict[str, Any]]:
-    """Retrieves a single shop item by name."""
-    async with aiosqlite.connect(DB_FILE) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM shop_items WHERE guild_id = ? AND name = ?", (guild_id, name)) as cursor:
-            result = await cursor.fetchone()
-            return dict(result) if result else None
-
-async def get_all_shop_items(guild_id: int) -> List[Dict[str, Any]]:
-    """Retrieves all shop items for a guild."""
-    async with aiosqlite.connect(DB_FILE) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM shop_items WHERE guild_id = ? ORDER BY cost ASC", (guild_id,)) as cursor:
-            return [dict(row) for row in await cursor.fetchall()]
-
-async def mark_item_as_purchased(item_id: int, user_id: int):
-    """Marks a one-time-buy item as sold."""
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("UPDATE shop_items SET purchased_by_user_id = ? WHERE item_id = ?", (user_id, item_id))
-        await db.commit()
\ No newline at end of file
+    async with _transaction() as db:
+        async with db.execute("DELETE FROM shop_items WHERE guild_id = ? AND name = ?", (guild_id, name)) as cursor:
+            removed = cursor.rowcount > 0
+        await db.commit()
+    if removed:
+        _shop_names.pop(guild_id, None)
+    return removed
+
+async def get_shop_item_for_buy(guild_id: int, name: str) -> Optional[aiosqlite.Row]:
+    """Retrieves the columns shop_buy needs for a single shop item by name."""
+    db = get_db()
+    async with _db_lock:
+        async with db.execute(
+            "SELECT item_id, cost, role_id, image_url, is_one_time_buy, purchased_by_user_id FROM shop_items WHERE guild_id = ? AND name = ?",
+            (guild_id, name)
+        ) as cursor:
+            return await cursor.fetchone()
+
+async def get_shop_item_names(guild_id: int) -> List[str]:
+    """Retrieves just the item names for a guild, served from a short-lived cache."""
+    cached = _shop_names.get(guild_id)
+    if cached and time.monotonic() - cached[0] < SHOP_NAMES_TTL:
+        return cached[1]
+    db = get_db()
+    async with _db_lock:
+        async with db.execute("SELECT name FROM shop_items WHERE guild_id = ? ORDER BY cost ASC", (guild_id,)) as cursor:
+            names = [row["name"] for row in await cursor.fetchall()]
+    _shop_names[guild_id] = (time.monotonic(), names)
+    return names
+
+async def get_all_shop_items(guild_id: int) -> List[aiosqlite.Row]:
+    """Retrieves the displayed columns of all shop items for a guild."""
+    db = get_db()
+    async with _db_lock:
+        async with db.execute(
+            "SELECT name, cost, role_id, is_one_time_buy, purchased_by_user_id FROM shop_items WHERE guild_id = ? ORDER BY cost ASC",
+            (guild_id,)
+        ) as cursor:
+            return await cursor.fetchall()
+
+async def debit_and_mark(user_id: int, cost: int, item_id: int, one_time: bool) -> bool:
+    """
+    Charges a user for an item and, for one-time buys, claims it, in a single transaction.
+    Returns False (changing nothing) if the user can't afford it or the item is already claimed.
+    """
+    async with _transaction() as db:
+        async with db.execute(
+            "UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ?",
+            (cost, user_id, cost)
+        ) as cursor:
+            if cursor.rowcount == 0:
+                return False
+        if one_time:
+            async with db.execute(
+                "UPDATE shop_items SET purchased_by_user_id = ? WHERE item_id = ? AND purchased_by_user_id IS NULL",
+                (user_id, item_id)
+            ) as cursor:
+                if cursor.rowcount == 0:
+                    return False
+        await db.commit()
+    _invalidate_lb()
+    return True
+
+async def refund_purchase(user_id: int, cost: int, item_id: int, one_time: bool):
+    """Reverses debit_and_mark when the reward could not be delivered."""
+    async with _transaction() as db:
+        await db.execute(
+            "INSERT INTO users (user_id, balance) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance",
+            (user_id, cost)
+        )
+        if one_time:
+            await db.execute(
+                "UPDATE shop_items SET purchased_by_user_id = NULL WHERE item_id = ? AND purchased_by_user_id = ?",
+                (item_id, user_id)
+            )
+        await db.commit()
+    _invalidate_lb()